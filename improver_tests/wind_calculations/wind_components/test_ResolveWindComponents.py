@@ -30,6 +30,7 @@
 # POSSIBILITY OF SUCH DAMAGE.
 """Unit tests for the wind_components.ResolveWindComponents plugin."""
 
+import functools
 import unittest
 
 import iris
@@ -42,39 +43,77 @@ from iris.tests import IrisTest
 from improver.synthetic_data.set_up_test_cubes import set_up_variable_cube
 from improver.wind_calculations.wind_components import ResolveWindComponents
 
-RAD_TO_DEG = 180.0 / np.pi
+OSGB_CRS = OSGB()
 
 
-def set_up_cube(data_2d, name, unit):
-    """Set up a 2D test cube of wind direction or speed"""
+@functools.lru_cache()
+def _get_xy_coords(shape):
+    """Set up OSGB projection x and y coordinates for a 2D grid of the given
+    shape.  The results are cached and shared, so must not be modified."""
+    x_coord = DimCoord(
+        np.linspace(150000, 250000, shape[1]),
+        "projection_x_coordinate",
+        units="metres",
+        coord_system=OSGB_CRS,
+    )
+    y_coord = DimCoord(
+        np.linspace(0, 600000, shape[0]),
+        "projection_y_coordinate",
+        units="metres",
+        coord_system=OSGB_CRS,
+    )
+    return x_coord, y_coord
+
+
+@functools.lru_cache()
+def _set_up_template_cube(shape, name, unit):
+    """Set up a 2D template cube of the given shape, name and units.  The
+    result is cached and must be copied before use."""
 
     cube = set_up_variable_cube(
-        data_2d.astype(np.float32), name=name, units=unit, spatial_grid="equalarea"
+        np.zeros(shape, dtype=np.float32),
+        name=name,
+        units=unit,
+        spatial_grid="equalarea",
     )
 
-    cube.coord("projection_x_coordinate").points = np.linspace(
-        150000, 250000, data_2d.shape[1]
-    )
-    cube.coord("projection_y_coordinate").points = np.linspace(
-        0, 600000, data_2d.shape[0]
-    )
-    for axis in ["x", "y"]:
-        cube.coord(axis=axis).units = "metres"
-        cube.coord(axis=axis).coord_system = OSGB()
-        cube.coord(axis=axis).bounds = None
+    for coord in _get_xy_coords(shape):
+        (dim,) = cube.coord_dims(coord.name())
+        cube.remove_coord(coord.name())
+        cube.add_dim_coord(coord, dim)
 
     return cube
 
 
+def set_up_cube(data_2d, name, unit):
+    """Set up a 2D test cube of wind direction or speed"""
+    template = _set_up_template_cube(data_2d.shape, name, unit)
+    return template.copy(data=data_2d.astype(np.float32))
+
+
 def add_new_dimension(cube, npoints, name, unit):
-    """Add a new dimension with npoints by copying cube data"""
-    cubelist = iris.cube.CubeList([])
-    for i in range(npoints):
-        newcube = cube.copy(cube.data)
-        newcube.add_aux_coord(DimCoord(i, name, unit))
-        cubelist.append(newcube)
-    merged_cube = cubelist.merge_cube()
-    return merged_cube
+    """Add a new leading dimension with npoints by broadcasting cube data"""
+    # The plugin modifies direction data in place, so the broadcast view
+    # is made contiguous (and writeable) before use
+    data = np.ascontiguousarray(np.broadcast_to(cube.data, (npoints,) + cube.shape))
+    new_coord = DimCoord(np.arange(npoints, dtype=np.int32), name, unit)
+    dim_coords_and_dims = [(new_coord, 0)] + [
+        (coord.copy(), cube.coord_dims(coord)[0] + 1)
+        for coord in cube.coords(dim_coords=True)
+    ]
+    aux_coords_and_dims = [
+        (coord.copy(), tuple(dim + 1 for dim in cube.coord_dims(coord)))
+        for coord in cube.coords(dim_coords=False)
+    ]
+    new_cube = iris.cube.Cube(
+        data,
+        units=cube.units,
+        attributes=cube.attributes,
+        dim_coords_and_dims=dim_coords_and_dims,
+        aux_coords_and_dims=aux_coords_and_dims,
+    )
+    new_cube.rename(cube.name())
+    return new_cube
 
 
 class Test__repr__(IrisTest):
@@ -89,11 +128,23 @@ class Test__repr__(IrisTest):
 class Test_calc_true_north_offset(IrisTest):
     """Tests the calc_true_north_offset function"""
 
-    def setUp(self):
-        """Set up a target cube with OSGB projection"""
+    @classmethod
+    def setUpClass(cls):
+        """Set up a target cube with OSGB projection and the expected angle
+        adjustments in radians"""
         wind_angle = np.zeros((3, 5), dtype=np.float32)
-        self.directions = set_up_cube(wind_angle, "wind_to_direction", "degrees")
-        self.plugin = ResolveWindComponents()
+        cls.directions = set_up_cube(wind_angle, "wind_to_direction", "degrees")
+        cls.plugin = ResolveWindComponents()
+        cls.expected_result = np.deg2rad(
+            np.array(
+                [
+                    [2.651483, 2.386892, 2.122119, 1.857182, 1.592121],
+                    [2.921058, 2.629620, 2.337963, 2.046132, 1.754138],
+                    [3.223816, 2.902300, 2.580523, 2.258494, 1.936247],
+                ],
+                dtype=np.float32,
+            )
+        )
 
     def test_basic(self):
         """Test function returns correct type"""
@@ -103,26 +154,20 @@ class Test_calc_true_north_offset(IrisTest):
     def test_values(self):
         """Test that for UK National Grid coordinates the angle adjustments
         are sensible"""
-        expected_result = np.array(
-            [
-                [2.651483, 2.386892, 2.122119, 1.857182, 1.592121],
-                [2.921058, 2.629620, 2.337963, 2.046132, 1.754138],
-                [3.223816, 2.902300, 2.580523, 2.258494, 1.936247],
-            ],
-            dtype=np.float32,
-        )
         result = self.plugin.calc_true_north_offset(self.directions)
-        self.assertArrayAlmostEqual(RAD_TO_DEG * result, expected_result)
+        self.assertArrayAlmostEqual(result, self.expected_result)
 
 
 class Test_resolve_wind_components(IrisTest):
     """Tests the resolve_wind_components method"""
 
-    def setUp(self):
-        """Set up some arrays to convert"""
-        self.plugin = ResolveWindComponents()
+    @classmethod
+    def setUpClass(cls):
+        """Set up some arrays to convert.  The plugin modifies the direction
+        cube in place, so tests must pass it a copy."""
+        cls.plugin = ResolveWindComponents()
         wind_speed = 10.0 * np.ones((4, 4), dtype=np.float32)
-        wind_angle = np.array(
+        cls.wind_angle = np.array(
             [
                 [0.0, 30.0, 45.0, 60.0],
                 [90.0, 120.0, 135.0, 150.0],
@@ -131,43 +176,29 @@ class Test_resolve_wind_components(IrisTest):
             ],
             dtype=np.float32,
         )
-        self.wind_cube = set_up_cube(wind_speed, "wind_speed", "knots")
-        self.directions = set_up_cube(wind_angle, "wind_to_direction", "degrees")
-        self.adjustments = np.zeros((4, 4), dtype=np.float32)
+        cls.wind_cube = set_up_cube(wind_speed, "wind_speed", "knots")
+        cls.directions = set_up_cube(cls.wind_angle, "wind_to_direction", "degrees")
+        cls.adjustments = np.zeros((4, 4), dtype=np.float32)
 
     def test_basic(self):
         """Test function returns correct type"""
         uspeed, vspeed = self.plugin.resolve_wind_components(
-            self.wind_cube, self.directions, self.adjustments
+            self.wind_cube, self.directions.copy(), self.adjustments
         )
         self.assertIsInstance(uspeed, iris.cube.Cube)
         self.assertIsInstance(vspeed, iris.cube.Cube)
 
     def test_values(self):
         """Test correct values are returned for well-behaved angles"""
-        expected_uspeed = 5.0 * np.array(
-            [
-                [0.0, 1.0, np.sqrt(2.0), np.sqrt(3.0)],
-                [2.0, np.sqrt(3.0), np.sqrt(2.0), 1.0],
-                [0.0, -1.0, -np.sqrt(2.0), -np.sqrt(3.0)],
-                [-2.0, -np.sqrt(3.0), -np.sqrt(2.0), -1.0],
-            ],
-            dtype=np.float32,
-        )
-
-        expected_vspeed = 5 * np.array(
-            [
-                [2.0, np.sqrt(3.0), np.sqrt(2.0), 1.0],
-                [0.0, -1.0, -np.sqrt(2.0), -np.sqrt(3.0)],
-                [-2.0, -np.sqrt(3.0), -np.sqrt(2.0), -1.0],
-                [0.0, 1.0, np.sqrt(2.0), np.sqrt(3.0)],
-            ],
-            dtype=np.float32,
-        )
+        angle_radians = np.deg2rad(self.wind_angle)
+        expected_uspeed = 10.0 * np.sin(angle_radians)
+        expected_vspeed = 10.0 * np.cos(angle_radians)
 
         uspeed, vspeed = self.plugin.resolve_wind_components(
-            self.wind_cube, self.directions, self.adjustments
+            self.wind_cube, self.directions.copy(), self.adjustments
         )
+        self.assertEqual(uspeed.dtype, np.float32)
+        self.assertEqual(vspeed.dtype, np.float32)
         self.assertArrayAlmostEqual(uspeed.data, expected_uspeed, decimal=5)
         self.assertArrayAlmostEqual(vspeed.data, expected_vspeed, decimal=5)
 
@@ -175,23 +206,25 @@ class Test_resolve_wind_components(IrisTest):
 class Test_process(IrisTest):
     """Tests the process method"""
 
-    def setUp(self):
-        """Create dummy cubes for tests"""
-        self.plugin = ResolveWindComponents()
+    @classmethod
+    def setUpClass(cls):
+        """Create dummy cubes for tests.  The plugin modifies the direction
+        cube in place, so tests must pass it a copy."""
+        cls.plugin = ResolveWindComponents()
         wind_speed_data = np.array(
             [[6, 5, 4, 3], [8, 6, 4, 4], [12, 8, 6, 5]], dtype=np.float32
         )
-        self.wind_speed_cube = set_up_cube(wind_speed_data, "wind_speed", "knots")
+        cls.wind_speed_cube = set_up_cube(wind_speed_data, "wind_speed", "knots")
 
         wind_direction_data = np.array(
             [[138, 142, 141, 141], [141, 143, 140, 142], [142, 146, 141, 142]],
             dtype=np.float32,
         )
-        self.wind_direction_cube = set_up_cube(
+        cls.wind_direction_cube = set_up_cube(
             wind_direction_data, "wind_to_direction", "degrees"
         )
 
-        self.expected_u = np.array(
+        cls.expected_u = np.array(
             [
                 [3.804214, 2.917800, 2.410297, 1.822455],
                 [4.711193, 3.395639, 2.454748, 2.365005],
@@ -200,7 +233,7 @@ class Test_process(IrisTest):
             dtype=np.float32,
         )
 
-        self.expected_v = np.array(
+        cls.expected_v = np.array(
             [
                 [-4.639823, -4.060351, -3.1922507, -2.382994],
                 [-6.465651, -4.946681, -3.1581972, -3.225949],
@@ -212,7 +245,7 @@ class Test_process(IrisTest):
     def test_basic(self):
         """Test plugin creates two output cubes with the correct metadata"""
         ucube, vcube = self.plugin.process(
-            self.wind_speed_cube, self.wind_direction_cube
+            self.wind_speed_cube, self.wind_direction_cube.copy()
         )
         for cube in ucube, vcube:
             self.assertIsInstance(cube, iris.cube.Cube)
@@ -223,7 +256,7 @@ class Test_process(IrisTest):
     def test_values(self):
         """Test plugin generates expected wind values"""
         ucube, vcube = self.plugin.process(
-            self.wind_speed_cube, self.wind_direction_cube
+            self.wind_speed_cube, self.wind_direction_cube.copy()
         )
         self.assertArrayAlmostEqual(ucube.data, self.expected_u)
         self.assertArrayAlmostEqual(vcube.data, self.expected_v)
@@ -231,19 +264,21 @@ class Test_process(IrisTest):
     def test_coordinate_value_mismatch(self):
         """Test an error is raised if coordinate values are different for wind
         speed and direction cubes"""
-        self.wind_direction_cube.coord(axis="y").convert_units("km")
+        wind_dir = self.wind_direction_cube.copy()
+        wind_dir.coord(axis="y").convert_units("km")
         msg = "Wind speed and direction cubes have unmatched coordinates"
         with self.assertRaisesRegex(ValueError, msg):
-            _, _ = self.plugin.process(self.wind_speed_cube, self.wind_direction_cube)
+            _, _ = self.plugin.process(self.wind_speed_cube, wind_dir)
 
     def test_projection_mismatch(self):
         """Test an error is raised if coordinate names are different for wind
         speed and direction cubes"""
-        self.wind_speed_cube.coord(axis="x").rename("longitude")
-        self.wind_speed_cube.coord(axis="y").rename("latitude")
+        wind_speed = self.wind_speed_cube.copy()
+        wind_speed.coord(axis="x").rename("longitude")
+        wind_speed.coord(axis="y").rename("latitude")
         msg = "Wind speed and direction cubes have unmatched coordinates"
         with self.assertRaisesRegex(ValueError, msg):
-            _, _ = self.plugin.process(self.wind_speed_cube, self.wind_direction_cube)
+            _, _ = self.plugin.process(wind_speed, self.wind_direction_cube.copy())
 
     def test_height_levels(self):
         """Test a cube on more than one height level is correctly processed"""
@@ -266,10 +301,9 @@ class Test_process(IrisTest):
         """
         expected_u = -1.0 * self.expected_u
         expected_v = -1.0 * self.expected_v
-        self.wind_direction_cube.rename("wind_from_direction")
-        ucube, vcube = self.plugin.process(
-            self.wind_speed_cube, self.wind_direction_cube
-        )
+        wind_dir = self.wind_direction_cube.copy()
+        wind_dir.rename("wind_from_direction")
+        ucube, vcube = self.plugin.process(self.wind_speed_cube, wind_dir)
         self.assertArrayAllClose(ucube.data, expected_u, atol=1e-5)
         self.assertArrayAllClose(vcube.data, expected_v, atol=1e-5)
 